@@ -14,20 +14,81 @@ LASTFM_SESSION_KEY.
 """
 
 import argparse
+import atexit
 import hashlib
 import os
 import signal
 import sys
+import threading
 import time
 import json
-import xml.etree.ElementTree as ET
-from datetime import datetime, timezone
+from collections import deque
+from itertools import islice
+from datetime import datetime, timedelta, timezone
 import requests as r
+from requests.adapters import HTTPAdapter
+from urllib3.util import Retry
 from dateutil import parser, tz
 from dotenv import load_dotenv, set_key
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 LASTFM_API_URL = "https://ws.audioscrobbler.com/2.0/"
 SPINITRON_API_URL = "https://spinitron.com/api"
+SPIN_POLL_INTERVAL = 15
+SPINITRON_CACHE_TTL = 600
+HTTP_TIMEOUT = (5, 15)  # (connect, read) seconds
+# Used for the final scrobble flush on shutdown, which has to fit in Docker's stop grace period
+SHUTDOWN_HTTP_TIMEOUT = (2, 5)
+SCROBBLE_BATCH_SIZE = 50  # Maximum number of scrobbles Last.fm accepts per request
+
+# Shared session so that connections to Last.fm and Spinitron are kept alive and reused across
+# iterations of the polling loop instead of doing a new TCP + TLS handshake for every request.
+# Retries only apply to idempotent methods (i.e. not the Last.fm POSTs).
+SESSION = r.Session()
+SESSION.mount(
+    "https://",
+    HTTPAdapter(
+        pool_connections=4,
+        pool_maxsize=8,
+        max_retries=Retry(
+            total=3,
+            backoff_factor=0.3,
+            status_forcelist=[429, 502, 503, 504],
+            # Hand the last error response back so the existing status handling applies
+            raise_on_status=False,
+        ),
+    ),
+)
+atexit.register(SESSION.close)
+
+# Set by stop_handler on SIGINT/SIGTERM while the scrobbler is running, so that sleeps in the
+# polling loop return early and the process can shut down cleanly
+STOP = threading.Event()
+
+
+def decode_json(response):
+    """
+    Decodes the JSON body of a response, using orjson when it is installed
+
+    Args:
+        response (requests.Response): Response object that is returned by an HTTP request
+    Returns:
+        The decoded response body
+    Raises:
+        requests.exceptions.JSONDecodeError: If the body is not valid JSON. Like
+            response.json(), this is both a RequestException and a ValueError
+    """
+    try:
+        if orjson:
+            return orjson.loads(response.content)
+        return json.loads(response.content)
+    except json.JSONDecodeError as e:
+        # orjson.JSONDecodeError subclasses json.JSONDecodeError
+        raise r.exceptions.JSONDecodeError(e.msg, e.doc, e.pos) from e
 
 
 class Colors:
@@ -45,7 +106,7 @@ class Colors:
     RESET = "\033[0m"
 
 
-ERROR_CODES = [16, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 13, 16, 26, 29]
+ERROR_CODES = frozenset({2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 13, 16, 26, 29})
 """
 According to the Last.fm documentation:
 16 : The service is temporarily unavailable, please try again.
@@ -69,6 +130,7 @@ According to the Last.fm documentation:
 load_dotenv(dotenv_path="/env/.env")
 lastfm_api_key = os.getenv("LASTFM_API_KEY")
 lastfm_api_secret = os.getenv("LASTFM_API_SECRET")
+lastfm_api_secret_bytes = (lastfm_api_secret or "").encode("utf-8")
 lastfm_session_key = os.getenv("LASTFM_SESSION_KEY")
 spinitron_api_key = os.getenv("SPINITRON_API_KEY")
 spinitron_headers = {"Authorization": f"Bearer {spinitron_api_key}"}
@@ -80,17 +142,106 @@ with open("schedule.json", "r") as f:
 start_hour = config.get("start_hour")
 end_hour = config.get("end_hour")
 
+# Bitmask of the UTC hours (bit h set for hour h) that fall inside the scrobbling schedule,
+# accounting for schedules that wrap past midnight (start_hour > end_hour)
+SCHEDULE_MASK = sum(
+    1 << hour
+    for hour in range(24)
+    if (start_hour <= hour < end_hour)
+    or (start_hour > end_hour and (hour >= start_hour or hour < end_hour))
+)
+
+# Playlists and personas rarely change over the course of a show, so they are cached by ID
+playlist_cache = {}
+persona_cache = {}
+
+# Scrobbles waiting to be submitted to Last.fm, oldest first
+pending_scrobbles = deque()
+
+
+class Timestamp:
+    """
+    Local time that is only read and formatted when converted to a string, so log lines can
+    reference it without paying for formatting on iterations where nothing is printed
+
+    Args:
+        precise (bool, optional): Format as H:M:S:microseconds instead of Y-m-d H:M:S
+    """
+
+    def __init__(self, precise=False):
+        self.precise = precise
+
+    def __str__(self):
+        now = datetime.now()
+        if self.precise:
+            return f"{now.hour:02d}:{now.minute:02d}:{now.second:02d}:{now.microsecond:06d}"
+        return f"{now.year:04d}-{now.month:02d}-{now.day:02d} {now.hour:02d}:{now.minute:02d}:{now.second:02d}"
+
+
+LOG_TIMESTAMP = Timestamp()
+PRECISE_TIMESTAMP = Timestamp(precise=True)
+
 
 def signal_handler(sig, frame):
     """
-    Ctrl+C handler
+    Ctrl+C / SIGTERM handler, used outside of the polling loop (e.g. during setup)
+    """
+    print(
+        Colors.RED
+        + f"\n{signal.Signals(sig).name} received, aborting application. Goodbye!"
+        + Colors.RESET
+    )
+    sys.exit(0)
+
+
+def stop_handler(sig, frame):
+    """
+    Ctrl+C / SIGTERM handler for the polling loop. Rather than exiting mid-request, this sets
+    STOP so that the loop shuts down at its next idle()
     """
     print(
-        Colors.RED + "\nCtrl+C pressed, aborting application. Goodbye!" + Colors.RESET
+        Colors.RED
+        + f"\n{signal.Signals(sig).name} received, stopping scrobbler..."
+        + Colors.RESET
     )
+    STOP.set()
+
+
+def idle(seconds):
+    """
+    Sleeps for the given number of seconds, or shuts down if STOP is set in the meantime. Any
+    scrobbles still queued are submitted before exiting.
+
+    Args:
+        seconds (float): How long to sleep for
+    """
+    if not STOP.wait(max(seconds, 0)):
+        return
+
+    if pending_scrobbles:
+        flush_scrobbles(lastfm_session_key, timeout=SHUTDOWN_HTTP_TIMEOUT)
+    if pending_scrobbles:
+        print(
+            Colors.RED
+            + f"Could not submit {len(pending_scrobbles)} queued scrobble(s) before exiting, they have been dropped."
+            + Colors.RESET
+        )
+    print(Colors.RED + "Goodbye!" + Colors.RESET)
     sys.exit(0)
 
 
+def is_placeholder(value):
+    """
+    Checks whether a .env value was left as the example value (made up entirely of x's)
+
+    Args:
+        value (str): The value to check
+    Returns:
+        bool: True if value is non-empty and consists only of 'x' or 'X' characters
+    """
+    return bool(value) and not value.lower().strip("x")
+
+
 def generate_signature(params):
     """
     Takes parameters for a request and generates an md5 hash signature as specified in the Last.fm
@@ -101,11 +252,12 @@ def generate_signature(params):
     Returns:
         str: The generated signature, as a string
     """
-    signature = ""
+    signature = hashlib.md5(usedforsecurity=False)
     for key in sorted(params):
-        signature += key + str(params[key])
-    signature += lastfm_api_secret
-    return hashlib.md5(signature.encode("utf-8")).hexdigest()
+        signature.update(key.encode("utf-8"))
+        signature.update(str(params[key]).encode("utf-8"))
+    signature.update(lastfm_api_secret_bytes)
+    return signature.hexdigest()
 
 
 def get_token():
@@ -117,10 +269,11 @@ def get_token():
     """
     params = {"method": "auth.getToken", "api_key": lastfm_api_key}
     params["api_sig"] = generate_signature(params)
+    # Not part of the signature, per the Last.fm authentication specs
+    params["format"] = "json"
 
-    response = r.post(LASTFM_API_URL, params=params)
-    root = ET.fromstring(response.content)
-    return root.find("./token").text
+    response = SESSION.post(LASTFM_API_URL, params=params, timeout=HTTP_TIMEOUT)
+    return decode_json(response)["token"]
 
 
 def get_session_key(token):
@@ -135,17 +288,16 @@ def get_session_key(token):
     """
     params = {"method": "auth.getSession", "api_key": lastfm_api_key, "token": token}
     params["api_sig"] = generate_signature(params)
+    params["format"] = "json"
 
-    response = r.post(LASTFM_API_URL, params=params)
-    root = ET.fromstring(response.content)
-    session_key_element = root.find("./session/key")
-    if session_key_element is None:
+    response = SESSION.post(LASTFM_API_URL, params=params, timeout=HTTP_TIMEOUT)
+    session_key = decode_json(response).get("session", {}).get("key")
+    if session_key is None:
         print(
             '\nSession key not returned from Last.fm. Did you open the link above and press "yes, allow access?" Aborting setup.'
         )
         sys.exit(0)
 
-    session_key = session_key_element.text
     return session_key
 
 
@@ -160,10 +312,123 @@ def get_sleep_duration(start_hour):
     if desired_time < current_datetime:
         # If the desired start time is already passed for today,
         # set it for the next day
-        desired_time += datetime.timedelta(days=1)
+        desired_time += timedelta(days=1)
     return (desired_time - current_datetime).total_seconds()
 
 
+def fetch_current_spin():
+    """
+    Fetches the most recent spin from Spinitron
+
+    Returns:
+        dict: The most recent spin, as returned by the Spinitron API
+    Raises:
+        requests.exceptions.RequestException: If the request fails or returns an error status
+        KeyError, IndexError: If the response doesn't contain a spin
+    """
+    response = SESSION.get(
+        f"{SPINITRON_API_URL}/spins?count=1",
+        headers=spinitron_headers,
+        timeout=HTTP_TIMEOUT,
+    )
+    response.raise_for_status()
+    return decode_json(response)["items"][0]
+
+
+def parse_spin_time(value):
+    """
+    Parses a Spinitron timestamp (ISO 8601, e.g. '2024-01-02T03:04:05+0000'), falling back to
+    dateutil for anything datetime.fromisoformat doesn't accept
+
+    Args:
+        value (str): Timestamp string from a Spinitron spin
+    Returns:
+        datetime: The parsed timestamp
+    """
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        return parser.parse(value)
+
+
+def fetch_spinitron_resource(resource, resource_id, required_field, cache):
+    """
+    Fetches a Spinitron resource by ID, reusing a previously fetched copy if it is younger than
+    SPINITRON_CACHE_TTL seconds. Only successful responses containing required_field are cached.
+
+    Args:
+        resource (str): The API collection name (e.g. 'playlists')
+        resource_id (int): ID of the resource to fetch
+        required_field (str): Field that must be present in a valid response body
+        cache (dict): Maps resource IDs to (fetch time, response body) tuples
+    Returns:
+        tuple: Status code (int) and parsed response body (dict), or the raw response text (str)
+            if the status code isn't 200
+    """
+    now = time.monotonic()
+    cached = cache.get(resource_id)
+    if cached and now - cached[0] < SPINITRON_CACHE_TTL:
+        return 200, cached[1]
+
+    response = SESSION.get(
+        f"{SPINITRON_API_URL}/{resource}/{resource_id}",
+        headers=spinitron_headers,
+        timeout=HTTP_TIMEOUT,
+    )
+    # Error pages (e.g. a 503 from a proxy) aren't necessarily JSON
+    if response.status_code != 200:
+        return response.status_code, response.text
+
+    body = decode_json(response)
+    if required_field in body:
+        # Drop expired entries so the cache doesn't grow over the lifetime of the process
+        for key in [k for k, v in cache.items() if now - v[0] >= SPINITRON_CACHE_TTL]:
+            del cache[key]
+        cache[resource_id] = (now, body)
+    return response.status_code, body
+
+
+def fetch_playlist(playlist_id):
+    """
+    Fetches a playlist from Spinitron, cached for SPINITRON_CACHE_TTL seconds
+    """
+    return fetch_spinitron_resource("playlists", playlist_id, "title", playlist_cache)
+
+
+def fetch_persona(persona_id):
+    """
+    Fetches a persona from Spinitron, cached for SPINITRON_CACHE_TTL seconds
+    """
+    return fetch_spinitron_resource("personas", persona_id, "name", persona_cache)
+
+
+def wait_for_song_end(spin_id, duration):
+    """
+    Idles until the current song is scheduled to end, re-polling Spinitron every
+    SPIN_POLL_INTERVAL seconds so that a newer spin logged before then (e.g. the DJ advanced or
+    edited the playlist mid-song) cuts the wait short instead of being missed
+
+    Args:
+        spin_id (int): ID of the spin that is currently playing
+        duration (float): Seconds remaining until the spin's scheduled end
+    Returns:
+        bool: True if the wait was cut short by a newer spin, False otherwise
+    """
+    deadline = time.monotonic() + duration
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= SPIN_POLL_INTERVAL:
+            idle(remaining)
+            return False
+        idle(SPIN_POLL_INTERVAL)
+        try:
+            if fetch_current_spin()["id"] != spin_id:
+                return True
+        except (r.exceptions.RequestException, KeyError, IndexError, ValueError):
+            # A failed check shouldn't lose the pending scrobble, keep waiting
+            continue
+
+
 def update_np(session_key, artist, track, album=None, duration=None):
     """
     Performs API call to track.updateNowPlaying to indicate to Last.fm that the user has started
@@ -192,8 +457,9 @@ def update_np(session_key, artist, track, album=None, duration=None):
     if duration:
         params["duration"] = duration
     params["api_sig"] = generate_signature(params)
+    params["format"] = "json"
 
-    response = r.post(LASTFM_API_URL, params=params)
+    response = SESSION.post(LASTFM_API_URL, params=params, timeout=HTTP_TIMEOUT)
 
     # Handle http error if necessary
     if not response.ok:
@@ -204,7 +470,8 @@ def update_np(session_key, artist, track, album=None, duration=None):
 
 def request_scrobble(session_key, artist, track, timestamp, album=None, duration=None):
     """
-    Performs API call to track.scrobble to indicate to Last.fm that the user has listened to a song
+    Queues a scrobble and submits the pending queue to Last.fm (see flush_scrobbles). Scrobbles
+    that could not be submitted earlier because of a temporary error go out in the same request.
 
     Args:
         session_key (str): A session key for an associated web service session generated by
@@ -215,34 +482,78 @@ def request_scrobble(session_key, artist, track, timestamp, album=None, duration
         album (str, optional): The album name
         duration (int, optional): The length of the track in seconds
     Returns:
-        int: Status code of the response
+        int: Status code of the response, or None if the request could not be sent
+    """
+    scrobble = {"artist": artist, "track": track, "timestamp": timestamp}
+    if album:
+        scrobble["album"] = album
+    if duration:
+        scrobble["duration"] = duration
+    pending_scrobbles.append(scrobble)
+
+    status_code = flush_scrobbles(session_key)
+    if pending_scrobbles:
+        print(
+            Colors.YELLOW
+            + f"{len(pending_scrobbles)} scrobble(s) kept queued for the next attempt."
+            + Colors.RESET
+        )
+    return status_code
+
+
+def flush_scrobbles(session_key, timeout=HTTP_TIMEOUT):
     """
+    Performs API call to track.scrobble to indicate to Last.fm that the user has listened to the
+    pending songs, submitting up to SCROBBLE_BATCH_SIZE of them at once using the indexed
+    parameter form (artist[0], track[0], ...). If Last.fm is unreachable or temporarily
+    unavailable (HTTP 429 or 5xx) the scrobbles stay queued for the next flush, otherwise they
+    are removed.
+
+    Args:
+        session_key (str): A session key for an associated web service session generated by
+            auth.getSession
+        timeout (tuple, optional): (connect, read) timeout in seconds for the request
+    Returns:
+        int: Status code of the response, or None if the request could not be sent
+    """
+    batch = list(islice(pending_scrobbles, SCROBBLE_BATCH_SIZE))
     params = {
         "method": "track.scrobble",
-        "artist": artist,
-        "track": track,
-        "timestamp": timestamp,
         "api_key": lastfm_api_key,
         "sk": session_key,
     }
-    if album:
-        params["album"] = album
-    if duration:
-        params["duration"] = duration
+    for index, scrobble in enumerate(batch):
+        for key, value in scrobble.items():
+            params[f"{key}[{index}]"] = value
     params["api_sig"] = generate_signature(params)
+    params["format"] = "json"
 
-    response = r.post(LASTFM_API_URL, params=params)
+    # Sent as a form body, since a full batch is too long for a query string
+    try:
+        response = SESSION.post(LASTFM_API_URL, data=params, timeout=timeout)
+    except r.exceptions.RequestException as e:
+        print(
+            Colors.RED
+            + f"Could not send scrobble request to Last.fm ({e})."
+            + Colors.RESET
+        )
+        return None
 
     # Handle http error if necessary
     if not response.ok:
         handle_lastfm_http_error(response=response, request_type="scrobble")
+        if response.status_code == 429 or response.status_code >= 500:
+            return response.status_code
+
+    for _ in batch:
+        pending_scrobbles.popleft()
 
     return response.status_code
 
 
 def handle_lastfm_http_error(response, request_type):
     """
-    Helper function for update_np and request_scrobble, which takes the returned response from an
+    Helper function for update_np and flush_scrobbles, which takes the returned response from an
     HTTP error, parses, and logs the information.
 
     Args:
@@ -258,10 +569,9 @@ def handle_lastfm_http_error(response, request_type):
     )
     try:
         # Get error info sent from last.fm if available
-        root = ET.fromstring(response.content)
-        data = root.find("./error")
-        http_error_str += f"\nLast.fm error code {data.get('code')}: {data.text}"
-    except ET.ParseError:
+        data = decode_json(response)
+        http_error_str += f"\nLast.fm error code {data['error']}: {data['message']}"
+    except (ValueError, KeyError):
         http_error_str += "\nCould not parse response data for more information."
 
     print(http_error_str)
@@ -297,9 +607,8 @@ def setup():
     session_key = get_session_key(token)
     print(Colors.GREEN + "\nSuccess!" + Colors.RESET)
 
-    current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     with open("/env/setup_done", "w") as setup_done_file:
-        setup_done_file.write(f"Setup completed at {current_time}\n")
+        setup_done_file.write(f"Setup completed at {LOG_TIMESTAMP}\n")
 
     return session_key
 
@@ -308,7 +617,8 @@ def run():
     """
     Execution to run when the user has already established a web service session
     """
-    timestamp_string = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    signal.signal(signal.SIGINT, stop_handler)
+    signal.signal(signal.SIGTERM, stop_handler)
 
     print("-------------------------------------")
     print("|                                   |")
@@ -321,7 +631,7 @@ def run():
     print("|              91.1 FM              |")
     print("|             wbor.org              |")
     print("-------------------------------------")
-    print(Colors.GREEN + f"STARTUP @ {timestamp_string}" + Colors.RESET)
+    print(Colors.GREEN + f"STARTUP @ {LOG_TIMESTAMP}" + Colors.RESET)
     print("\nSchedule:")
     print(f"START scrobbling at : {start_hour}:00 UTC")
     print(f"STOP scrobbling at  : {end_hour}:00 UTC\n")
@@ -332,192 +642,226 @@ def run():
     miss_count = 0
     last_spin_id = None
     while True:
-        timestamp_string = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        # If the current hour is outside of the defined schedule, sleep until the schedule starts
+        if not (SCHEDULE_MASK >> datetime.now(timezone.utc).hour) & 1:
+            sleep_duration = get_sleep_duration(start_hour)
+            print(
+                Colors.YELLOW
+                + f"\n---------{LOG_TIMESTAMP}---------\nOUTSIDE SCHEDULED SCROBBLING HOURS ({start_hour}:00-{end_hour}:00 UTC). Sleeping for next {sleep_duration} seconds until {start_hour}:00 UTC...\n"
+                + Colors.RESET
+            )
+            idle(sleep_duration)
+            continue
 
         # Get most recent spin info from Spinitron
-        current_spin = r.get(
-            f"{SPINITRON_API_URL}/spins?count=1", headers=spinitron_headers
-        ).json()["items"][0]
-        playlist_response = r.get(
-            f"{SPINITRON_API_URL}/playlists/{current_spin['playlist_id']}",
-            headers=spinitron_headers,
-        )
-        current_playlist = playlist_response.json()
+        try:
+            current_spin = fetch_current_spin()
+        except (r.exceptions.RequestException, ValueError, KeyError, IndexError) as e:
+            print(
+                Colors.YELLOW
+                + f"\n---------{LOG_TIMESTAMP}---------\nWARNING: Could not fetch spin data ({e}).\nRetrying in 10 seconds...\n"
+                + Colors.RESET
+            )
+            idle(10)
+            continue
+        spin_id = current_spin["id"]
+
+        # The spin ID is the same as the ID returned in the most recent request, so there is
+        # nothing new to look up
+        if spin_id == last_spin_id:
+            miss_count += 1
+            # print(Colors.YELLOW + f"\n{LOG_TIMESTAMP}\nMISS #{miss_count}" + Colors.RESET)
+
+            # In a perfect world, people spin in realtime, but in actuality, people get distracted and then batch-submit spins, which can lead to them being missed during this idle period.
+            #
+            # # If a miss occurs > 10 times in a row, idle for 3 minutes before next loop
+            # if miss_count > 10:
+            #     miss_str = Colors.YELLOW + f"\n---------{{LOG_TIMESTAMP}---------{\n{miss_count} requests since last spin. Currently {-1*int(time_difference)} seconds overdue according to last spin's end time value. Waiting 3 minutes before next request..." + Colors.RESET
+            #     print(miss_str)
+            #     time.sleep(180)
+
+            idle(15)
+            continue
+
+        try:
+            playlist_status, current_playlist = fetch_playlist(
+                current_spin["playlist_id"]
+            )
+        except (r.exceptions.RequestException, ValueError, KeyError, IndexError) as e:
+            print(
+                Colors.YELLOW
+                + f"\n---------{LOG_TIMESTAMP}---------\nWARNING: Could not fetch playlist data ({e}).\nRetrying in 10 seconds...\n"
+                + Colors.RESET
+            )
+            idle(10)
+            continue
 
         # Handle API errors or missing data
-        if playlist_response.status_code != 200 or "title" not in current_playlist:
+        if playlist_status != 200 or "title" not in current_playlist:
             print(
                 Colors.YELLOW
-                + f"\n---------{timestamp_string}---------\nWARNING: Could not fetch playlist data (status={playlist_response.status_code}). Response: {current_playlist}\nRetrying in 10 seconds...\n"
+                + f"\n---------{LOG_TIMESTAMP}---------\nWARNING: Could not fetch playlist data (status={playlist_status}). Response: {current_playlist}\nRetrying in 10 seconds...\n"
                 + Colors.RESET
             )
-            time.sleep(10)
+            idle(10)
             continue
 
         current_playlist_title = current_playlist["title"]
         current_playlist_category = current_playlist["category"]
 
-        persona_response = r.get(
-            f"{SPINITRON_API_URL}/personas/{current_playlist['persona_id']}",
-            headers=spinitron_headers,
-        )
-        current_persona = persona_response.json()
+        try:
+            persona_status, current_persona = fetch_persona(
+                current_playlist["persona_id"]
+            )
+        except (r.exceptions.RequestException, ValueError, KeyError, IndexError) as e:
+            print(
+                Colors.YELLOW
+                + f"\n---------{LOG_TIMESTAMP}---------\nWARNING: Could not fetch persona data ({e}).\nRetrying in 10 seconds...\n"
+                + Colors.RESET
+            )
+            idle(10)
+            continue
 
         # Handle API errors or missing data
-        if persona_response.status_code != 200 or "name" not in current_persona:
+        if persona_status != 200 or "name" not in current_persona:
             print(
                 Colors.YELLOW
-                + f"\n---------{timestamp_string}---------\nWARNING: Could not fetch persona data (status={persona_response.status_code}). Response: {current_persona}\nRetrying in 10 seconds...\n"
+                + f"\n---------{LOG_TIMESTAMP}---------\nWARNING: Could not fetch persona data (status={persona_status}). Response: {current_persona}\nRetrying in 10 seconds...\n"
                 + Colors.RESET
             )
-            time.sleep(10)
+            idle(10)
             continue
 
         current_persona_name = current_persona["name"]
+        last_spin_id = spin_id
 
         # Parse song data, get time difference between song end and current time
-        spin_id = current_spin["id"]
         spin_song_title = current_spin["song"]
         spin_artist = current_spin["artist"]
         spin_duration = current_spin["duration"]
 
-        song_start_datetime = parser.parse(current_spin["start"])
-        song_end_datetime = parser.parse(current_spin["end"])
+        song_start_datetime = parse_spin_time(current_spin["start"])
+        song_end_datetime = parse_spin_time(current_spin["end"])
         song_start_hour = song_start_datetime.hour
         current_datetime = datetime.now(timezone.utc)
-        current_hour = current_datetime.hour
         time_difference = (song_end_datetime - current_datetime).total_seconds()
 
-        # If the current hour is outside of the defined schedule, sleep until the schedule starts
-        if not (
-            (start_hour <= current_hour < end_hour)
-            or (
-                start_hour > end_hour
-                and (current_hour >= start_hour or current_hour < end_hour)
-            )
-        ):
-            sleep_duration = get_sleep_duration(start_hour)
+        # If the current spin started playing at a time outside of the allowed scrobbling
+        # schedule, pass
+        if not (SCHEDULE_MASK >> song_start_hour) & 1:
             print(
                 Colors.YELLOW
-                + f"\n---------{timestamp_string}---------\nOUTSIDE SCHEDULED SCROBBLING HOURS ({start_hour}:00-{end_hour}:00 UTC). Sleeping for next {sleep_duration} seconds until {start_hour}:00 UTC...\n"
+                + f"\n---------{LOG_TIMESTAMP}---------\nCURRENT SPIN BEGAN OUTSIDE SCHEDULED SCROBBLING HOURS. Disregarding...\n"
                 + Colors.RESET
             )
-            time.sleep(sleep_duration)
-        else:
-            # If the current spin started playing at a time outside of the allowed scrobbling
-            # schedule, pass
-            if not (
-                (start_hour <= song_start_hour < end_hour)
-                or (
-                    start_hour > end_hour
-                    and (song_start_hour >= start_hour or song_start_hour < end_hour)
-                )
-            ):
+            idle(15)
+        # Check if the new song is still playing
+        elif time_difference > 0:
+            # TODO: make this user-definable in a new file
+            if current_playlist_category and current_playlist_category != "Automation":
+                print(f"\n---------{LOG_TIMESTAMP}---------")
                 print(
-                    Colors.YELLOW
-                    + f"\n---------{timestamp_string}---------\nCURRENT SPIN BEGAN OUTSIDE SCHEDULED SCROBBLING HOURS. Disregarding...\n"
+                    Colors.GREEN
+                    + "NEW SONG: "
                     + Colors.RESET
+                    + f"{spin_artist} - {spin_song_title}"
                 )
-                time.sleep(15)
-            else:
-                # Check if a new song is playing
-                if (time_difference > 0) and (spin_id != last_spin_id):
-
-                    # TODO: make this user-definable in a new file
-                    if (
-                        current_playlist_category
-                        and current_playlist_category != "Automation"
-                    ):
-                        print(f"\n---------{timestamp_string}---------")
+                print(f"Spin ID: {spin_id}")
+                print(f"Spin Playlist: {current_playlist_title}")
+                print(f"Playlist Host: {current_persona_name}")
+
+                miss_count = 0
+
+                # Update now playing. A failure here shouldn't cost the scrobble, so carry on
+                # waiting for the end of the song either way
+                try:
+                    np_code = update_np(
+                        session_key=lastfm_session_key,
+                        artist=current_spin["artist"],
+                        track=current_spin["song"],
+                        album=current_spin["release"],
+                        duration=spin_duration,
+                    )
+                except r.exceptions.RequestException as e:
+                    print(
+                        Colors.YELLOW
+                        + f"WARNING: Now Playing request failed ({e}). Waiting for the end of song to submit scrobble..."
+                        + Colors.RESET
+                    )
+                else:
+                    if np_code in ERROR_CODES:
                         print(
-                            Colors.GREEN
-                            + "NEW SONG: "
+                            Colors.RED
+                            + f"ERROR: Now Playing request returned {np_code}"
                             + Colors.RESET
-                            + f"{spin_artist} - {spin_song_title}"
-                        )
-                        print(f"Spin ID: {spin_id}")
-                        print(f"Spin Playlist: {current_playlist_title}")
-                        print(f"Playlist Host: {current_persona_name}")
-
-                        miss_count = 0
-
-                        # Update now playing
-                        np_code = update_np(
-                            session_key=lastfm_session_key,
-                            artist=current_spin["artist"],
-                            track=current_spin["song"],
-                            album=current_spin["release"],
-                            duration=spin_duration,
                         )
-                        if np_code in ERROR_CODES:
-                            print(
-                                Colors.RED
-                                + f"ERROR: Now Playing request returned {np_code}"
-                                + Colors.RESET
-                            )
-                        else:
-                            timestamp_string = datetime.now().strftime("%H:%M:%S:%f")
-                            print(
-                                f"Now Playing updated successfully at {timestamp_string}\nWaiting for the end of song to submit scrobble..."
-                            )
-
-                        # Idle until end of song
-                        time.sleep(time_difference)
-
-                        # Last.fm asks that we only scrobbly songs longer than 30 seconds
-                        if spin_duration > 30:
-                            scrobble_code = request_scrobble(
-                                session_key=lastfm_session_key,
-                                artist=current_spin["artist"],
-                                track=current_spin["song"],
-                                timestamp=parser.parse(current_spin["end"]).timestamp(),
-                                album=current_spin["release"],
-                                duration=current_spin["duration"],
-                            )
-                            if scrobble_code in ERROR_CODES:
-                                print(
-                                    Colors.RED
-                                    + f"ERROR: playback finished but the scrobble request returned {scrobble_code}"
-                                    + Colors.RESET
-                                )
-                            else:
-                                timestamp_string = datetime.now().strftime(
-                                    "%H:%M:%S:%f"
-                                )
-                                print(f"✓ Scrobbled successfully at {timestamp_string}")
-                        else:
-                            print(
-                                f"SCROBBLE SKIPPED: {spin_song_title} has a length of {spin_duration}, which is too short to scrobble."
-                            )
-
-                        time.sleep(5)
                     else:
+                        print(
+                            f"Now Playing updated successfully at {PRECISE_TIMESTAMP}\nWaiting for the end of song to submit scrobble..."
+                        )
+
+                # Idle until end of song, or until a newer spin shows up
+                scrobble_datetime = song_end_datetime
+                played_duration = spin_duration
+                if wait_for_song_end(spin_id, time_difference):
+                    print(
+                        Colors.YELLOW
+                        + "A newer spin was logged before the scheduled end of this song."
+                        + Colors.RESET
+                    )
+                    # The song was cut short, so don't scrobble it with a timestamp in the future
+                    # and only count the time it actually played
+                    scrobble_datetime = min(
+                        song_end_datetime, datetime.now(timezone.utc)
+                    )
+                    played_duration = int(
+                        (scrobble_datetime - song_start_datetime).total_seconds()
+                    )
+
+                # Last.fm asks that we only scrobbly songs longer than 30 seconds
+                if played_duration > 30:
+                    scrobble_code = request_scrobble(
+                        session_key=lastfm_session_key,
+                        artist=current_spin["artist"],
+                        track=current_spin["song"],
+                        timestamp=scrobble_datetime.timestamp(),
+                        album=current_spin["release"],
+                        duration=current_spin["duration"],
+                    )
+                    if scrobble_code is None:
                         print(
                             Colors.RED
-                            + f"\n---------{timestamp_string}---------\nSPIN SKIPPED - belongs to playlist ({current_playlist_title}) with category `{current_playlist_category}`."
+                            + "ERROR: playback finished but the scrobble request could not be sent"
                             + Colors.RESET
                         )
-
-                # The spin ID is the same as the ID returned in the most recent request
+                    elif scrobble_code in ERROR_CODES:
+                        print(
+                            Colors.RED
+                            + f"ERROR: playback finished but the scrobble request returned {scrobble_code}"
+                            + Colors.RESET
+                        )
+                    else:
+                        print(f"✓ Scrobbled successfully at {PRECISE_TIMESTAMP}")
                 else:
-                    miss_count += 1
-                    # print(Colors.YELLOW + f"\n{timestamp_string}\nMISS #{miss_count}" + Colors.RESET)
-
-                    # In a perfect world, people spin in realtime, but in actuality, people get distracted and then batch-submit spins, which can lead to them being missed during this idle period.
-                    #
-                    # # If a miss occurs > 10 times in a row, idle for 3 minutes before next loop
-                    # if miss_count > 10:
-                    #     miss_str = Colors.YELLOW + f"\n---------{{timestamp_string}---------{\n{miss_count} requests since last spin. Currently {-1*int(time_difference)} seconds overdue according to last spin's end time value. Waiting 3 minutes before next request..." + Colors.RESET
-                    #     print(miss_str)
-                    #     time.sleep(180)
-
-                    time.sleep(15)
+                    print(
+                        f"SCROBBLE SKIPPED: {spin_song_title} played for {played_duration} seconds, which is too short to scrobble."
+                    )
 
-                last_spin_id = spin_id
+                idle(5)
+            else:
+                print(
+                    Colors.RED
+                    + f"\n---------{LOG_TIMESTAMP}---------\nSPIN SKIPPED - belongs to playlist ({current_playlist_title}) with category `{current_playlist_category}`."
+                    + Colors.RESET
+                )
+        # The new spin had already ended by the time it was seen (e.g. it was batch-submitted)
+        else:
+            idle(15)
 
 
 if __name__ == "__main__":
     signal.signal(signal.SIGINT, signal_handler)  # Ctrl+C handler
+    signal.signal(signal.SIGTERM, signal_handler)  # docker stop / systemd
 
     # Parse for --setup flag
     cli_parser = argparse.ArgumentParser()
@@ -531,8 +875,8 @@ if __name__ == "__main__":
     # Check if necessary env vars are either not present or left as example value
     if (not (lastfm_api_key and lastfm_api_secret and spinitron_api_key)) or (
         any(
-            all(char == "x" for char in string.lower())
-            for string in [lastfm_api_key, lastfm_api_secret, spinitron_api_key]
+            is_placeholder(string)
+            for string in (lastfm_api_key, lastfm_api_secret, spinitron_api_key)
         )
     ):
         print(
@@ -560,9 +904,7 @@ if __name__ == "__main__":
                 sys.exit(0)
         else:
             # Check if session key variable is not present or left as example value
-            if (not lastfm_session_key) or all(
-                char == "x" for char in lastfm_session_key.lower()
-            ):
+            if (not lastfm_session_key) or is_placeholder(lastfm_session_key):
                 print(
                     Colors.YELLOW
                     + 'Please make sure you have set your LASTFM_SESSION_KEY value in the ".env" file. If you have not yet established a web service session, please run the script in setup mode using the --setup argument.'
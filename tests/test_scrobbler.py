@@ -0,0 +1,125 @@
+import importlib
+import sys
+from datetime import datetime, timezone
+from pathlib import Path
+
+import pytest
+import requests
+
+SCROBBLER_DIR = Path(__file__).resolve().parent.parent / "scrobbler"
+
+
+@pytest.fixture
+def scrobbler(monkeypatch):
+    """
+    Imports scrobbler.py from its own directory, since it reads schedule.json relative to the
+    working directory at import time
+    """
+    monkeypatch.chdir(SCROBBLER_DIR)
+    monkeypatch.syspath_prepend(str(SCROBBLER_DIR))
+    sys.modules.pop("scrobbler", None)
+    yield importlib.import_module("scrobbler")
+    sys.modules.pop("scrobbler", None)
+
+
+def freeze_now(monkeypatch, module, frozen):
+    """
+    Replaces module.datetime so that datetime.now() returns frozen
+    """
+
+    class FrozenDatetime(datetime):
+        @classmethod
+        def now(cls, tz=None):
+            return frozen if tz is None else frozen.astimezone(tz)
+
+    monkeypatch.setattr(module, "datetime", FrozenDatetime)
+
+
+def test_get_sleep_duration_start_hour_already_passed(scrobbler, monkeypatch):
+    freeze_now(
+        monkeypatch, scrobbler, datetime(2024, 1, 2, 15, 30, tzinfo=timezone.utc)
+    )
+
+    duration = scrobbler.get_sleep_duration(6)
+
+    assert 0 < duration < 86400
+    # 15:30 today until 06:00 tomorrow
+    assert duration == 14.5 * 3600
+
+
+def test_get_sleep_duration_start_hour_later_today(scrobbler, monkeypatch):
+    freeze_now(monkeypatch, scrobbler, datetime(2024, 1, 2, 3, 0, tzinfo=timezone.utc))
+
+    assert scrobbler.get_sleep_duration(6) == 3 * 3600
+
+
+def make_response(status_code, content):
+    """
+    Builds a requests.Response with the given status code and raw body
+    """
+    response = requests.Response()
+    response.status_code = status_code
+    response.reason = "Service Unavailable" if status_code == 503 else "OK"
+    response.encoding = "utf-8"
+    response._content = content
+    return response
+
+
+def test_decode_json_raises_request_exception_on_bad_body(scrobbler):
+    response = make_response(503, b"<html>Service Unavailable</html>")
+
+    with pytest.raises(scrobbler.r.exceptions.RequestException):
+        scrobbler.decode_json(response)
+    with pytest.raises(ValueError):
+        scrobbler.decode_json(response)
+
+
+class StopLoop(Exception):
+    """
+    Raised from a patched idle() to break out of run()
+    """
+
+
+def run_until_idle(scrobbler, monkeypatch, responses):
+    """
+    Runs the polling loop against canned Spinitron responses (returned in order) until it first
+    calls idle(), returning the printed output and the requested idle duration
+    """
+    responses = iter(responses)
+    idles = []
+
+    def fake_idle(seconds):
+        idles.append(seconds)
+        raise StopLoop
+
+    monkeypatch.setattr(
+        scrobbler.SESSION, "get", lambda *args, **kwargs: next(responses)
+    )
+    monkeypatch.setattr(scrobbler, "idle", fake_idle)
+    monkeypatch.setattr(scrobbler, "SCHEDULE_MASK", (1 << 24) - 1)
+    with pytest.raises(StopLoop):
+        scrobbler.run()
+    return idles[0]
+
+
+def test_run_retries_on_spin_error_page(scrobbler, monkeypatch, capsys):
+    error_page = make_response(503, b"<html>Service Unavailable</html>")
+
+    assert run_until_idle(scrobbler, monkeypatch, [error_page]) == 10
+    assert "Could not fetch spin data" in capsys.readouterr().out
+
+
+def test_run_retries_on_playlist_error_page(scrobbler, monkeypatch, capsys):
+    spin = make_response(200, b'{"items": [{"id": 1, "playlist_id": 2}]}')
+    error_page = make_response(503, b"<html>Service Unavailable</html>")
+
+    assert run_until_idle(scrobbler, monkeypatch, [spin, error_page]) == 10
+    assert "Could not fetch playlist data (status=503)" in capsys.readouterr().out
+    assert 2 not in scrobbler.playlist_cache
+
+
+def test_run_retries_on_empty_spin_list(scrobbler, monkeypatch, capsys):
+    no_spins = make_response(200, b'{"items": []}')
+
+    assert run_until_idle(scrobbler, monkeypatch, [no_spins]) == 10
+    assert "Could not fetch spin data" in capsys.readouterr().out